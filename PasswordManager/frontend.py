@@ -1,115 +1,261 @@
 import os
-import json
-import base64
-import requests
+import re
+import orjson
+import functools
+import hmac
 import typer
 import hashlib
-import pyperclip
-from cryptography.hazmat.primitives.kdf.hkdf import HKDF
-from cryptography.hazmat.primitives import hashes
-from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from binascii import a2b_base64
 from dotenv import load_dotenv
 
+# requests, cryptography and pyperclip are imported lazily where they are
+# first needed: they dominate interpreter startup, and --help / usage-error
+# invocations never touch them
+
 load_dotenv()
 
-SERVER_URL = "http://192.168.100.96:3333" 
+SERVER_URL = "http://192.168.100.96:3333"
 USB_KEY_PATH = os.getenv("USB_KEY_PATH", "")
 USERNAME = os.getenv("USERNAME", "")
+# Only ever holds ciphertext + its ETag, never anything decrypted
+CACHE_DIR = os.path.expanduser("~/.jason_cache")
 
 app = typer.Typer()
 
+# One session for the whole process so every command shares the same
+# keep-alive connection to the server instead of re-handshaking.
+_session = None
+
+def get_session() -> "requests.Session":
+    global _session
+    if _session is None:
+        import requests
+        _session = requests.Session()
+        # One pooled keep-alive connection is enough for a CLI talking to
+        # a single server; retry once to paper over a dropped keep-alive.
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=4, max_retries=1)
+        _session.mount("http://", adapter)
+        _session.mount("https://", adapter)
+    return _session
+
+# Algorithm tags prefixed to every blob so decrypt can dispatch
+ALG_AESGCM = b"\x01"
+ALG_CHACHA = b"\x02"
+
+def _aes_accelerated() -> bool:
+    # AES-GCM is only the right default with hardware AES (AES-NI on x86,
+    # the crypto extensions on ARM). When /proc/cpuinfo is unavailable
+    # (macOS, Windows) assume modern hardware and keep AES.
+    try:
+        with open("/proc/cpuinfo") as f:
+            return re.search(r"\baes\b", f.read()) is not None
+    except OSError:
+        return True
+
+@functools.lru_cache(maxsize=4)
+def _derive_keys(master_secret: bytes):
+    from cryptography.hazmat.primitives.kdf.hkdf import HKDFExpand
+    from cryptography.hazmat.primitives import hashes
+
+    # Memoized so repeated CryptoEngine construction in one process only
+    # runs the HKDF expansions once per key file. The derived keys stay
+    # in memory only: persisting them to disk would defeat the whole
+    # point of keeping the master secret on a removable USB key.
+    #
+    # Run the HKDF extract step once and expand the shared PRK twice.
+    # HKDF(salt=None) extracts with an all-zero SHA-256-sized salt, so the
+    # keys are byte-identical to what the old double-HKDF produced.
+    prk = hmac.new(b"\x00" * 32, master_secret, hashlib.sha256).digest()
+
+    k_enc = HKDFExpand(
+        algorithm=hashes.SHA256(),
+        length=32,
+        info=b"JASON_VAULT_ENCRYPTION_KEY",
+    ).derive(prk)
+
+    k_auth = HKDFExpand(
+        algorithm=hashes.SHA256(),
+        length=32,
+        info=b"JASON_SERVER_AUTH_KEY",
+    ).derive(prk)
+
+    return k_enc, k_auth, hashlib.sha256(k_auth).hexdigest()
+
 class CryptoEngine:
     def __init__(self, key_file_path):
         if not os.path.exists(key_file_path):
             typer.secho(f"FATAL: Security key not found!", fg=typer.colors.RED, bold=True)
             typer.secho("Please insert ECHO1 and try again.", fg=typer.colors.RED, bold=True)
             raise typer.Exit(code=1)
-            
+
         with open(key_file_path, "rb") as f:
             master_secret = f.read()
-            
-        self.k_enc = HKDF(
-            algorithm=hashes.SHA256(),
-            length=32,
-            salt=None,
-            info=b"JASON_VAULT_ENCRYPTION_KEY",
-        ).derive(master_secret)
-        
-        self.k_auth = HKDF(
-            algorithm=hashes.SHA256(),
-            length=32,
-            salt=None,
-            info=b"JASON_SERVER_AUTH_KEY",
-        ).derive(master_secret)
-        
-        self.auth_hash = hashlib.sha256(self.k_auth).hexdigest()
 
-    def encrypt(self, data_dict: dict) -> str:
-        json_bytes = json.dumps(data_dict).encode('utf-8')
-        aesgcm = AESGCM(self.k_enc)
+        from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+        self.k_enc, self.k_auth, self.auth_hash = _derive_keys(master_secret)
+        # Build the ciphers once; AESGCM() runs a full AES key schedule every time
+        self._aesgcm = AESGCM(self.k_enc)
+        self._chacha = None
+        if _aes_accelerated():
+            self._alg, self._aead = ALG_AESGCM, self._aesgcm
+        else:
+            self._alg, self._aead = ALG_CHACHA, self._get_chacha()
+
+    def _get_chacha(self):
+        # Needed for decrypt even when this machine encrypts with AES-GCM,
+        # since another device may have written the blob
+        if self._chacha is None:
+            from cryptography.hazmat.primitives.ciphers.aead import ChaCha20Poly1305
+            self._chacha = ChaCha20Poly1305(self.k_enc)
+        return self._chacha
+
+    def encrypt(self, data_dict: dict) -> bytes:
+        json_bytes = orjson.dumps(data_dict)
         nonce = os.urandom(12)
-        ciphertext = aesgcm.encrypt(nonce, json_bytes, associated_data=None)
-        return base64.b64encode(nonce + ciphertext).decode('utf-8')
+        ciphertext = self._aead.encrypt(nonce, json_bytes, associated_data=None)
+        return self._alg + nonce + ciphertext
 
-    def decrypt(self, blob_b64: str) -> dict:
-        if not blob_b64:
+    def decrypt(self, blob: bytes) -> dict:
+        if not blob:
             return {} # Empty vault
-            
-        raw_data = base64.b64decode(blob_b64)
-        nonce = raw_data[:12]
-        ciphertext = raw_data[12:]
-        
-        aesgcm = AESGCM(self.k_enc)
+
+        alg = blob[:1]
         try:
-            plaintext = aesgcm.decrypt(nonce, ciphertext, associated_data=None)
-            return json.loads(plaintext.decode('utf-8'))
+            if alg == ALG_AESGCM:
+                plaintext = self._aesgcm.decrypt(blob[1:13], blob[13:], associated_data=None)
+            elif alg == ALG_CHACHA:
+                plaintext = self._get_chacha().decrypt(blob[1:13], blob[13:], associated_data=None)
+            else:
+                # Blob from before the algorithm tag existed
+                plaintext = self._aesgcm.decrypt(blob[:12], blob[12:], associated_data=None)
+            return orjson.loads(plaintext)
         except Exception:
+            if alg in (ALG_AESGCM, ALG_CHACHA):
+                # A legacy untagged blob can start with any byte; retry as one
+                try:
+                    plaintext = self._aesgcm.decrypt(blob[:12], blob[12:], associated_data=None)
+                    return orjson.loads(plaintext)
+                except Exception:
+                    pass
             typer.secho("Decryption Failed! Integrity check failed.", fg=typer.colors.RED)
             raise typer.Exit(code=1)
 
+class Vault(dict):
+    # A decrypted vault; the type index is built in one pass here so the
+    # ls commands don't rescan every entry per call
+    def __init__(self, entries: dict = None):
+        super().__init__(entries or {})
+        self._by_type = {}
+        for name, data in self.items():
+            if isinstance(data, dict):
+                self._by_type.setdefault(data.get("type", "password"), []).append(name)
+
+    def by_type(self, entry_type: str) -> list:
+        return self._by_type.get(entry_type, [])
+
 class VaultSync:
+    # After this many queued deltas, fold them into one full upload
+    COMPACT_AFTER = 32
+
     def __init__(self, crypto: CryptoEngine):
         self.crypto = crypto
-        self.session = requests.Session()
+        self.session = get_session()
 
-    def pull(self) -> dict:
-        payload = {
-            "username": USERNAME,
-            "client_auth_hash": self.crypto.auth_hash
+    def _auth_headers(self) -> dict:
+        return {
+            "X-User": USERNAME,
+            "X-Auth": self.crypto.auth_hash
         }
+
+    def _cache_paths(self):
+        base = os.path.join(CACHE_DIR, USERNAME or "default")
+        return base + ".blob", base + ".etag"
+
+    def pull(self) -> dict:
+        import requests
+
+        blob_path, etag_path = self._cache_paths()
+        headers = self._auth_headers()
+        if os.path.exists(blob_path) and os.path.exists(etag_path):
+            with open(etag_path) as f:
+                headers["If-None-Match"] = f.read().strip()
+
         try:
-            resp = self.session.post(f"{SERVER_URL}/vault/download", json=payload)
-            resp.raise_for_status()
-            data = resp.json()
-            return self.crypto.decrypt(data.get("vault_blob", ""))
+            resp = self.session.get(f"{SERVER_URL}/vault/download", headers=headers)
+            if resp.status_code == 304:
+                # Vault unchanged since last pull; reuse the cached ciphertext
+                with open(blob_path, "rb") as f:
+                    blob = f.read()
+            else:
+                resp.raise_for_status()
+                blob = resp.content
+                etag = resp.headers.get("ETag")
+                if etag:
+                    os.makedirs(CACHE_DIR, exist_ok=True)
+                    with open(blob_path, "wb") as f:
+                        f.write(blob)
+                    with open(etag_path, "w") as f:
+                        f.write(etag)
+
+            entries = self.crypto.decrypt(blob)
+            if int(resp.headers.get("X-Delta-Count", "0")):
+                self._apply_deltas(entries)
+            return Vault(entries)
         except requests.exceptions.ConnectionError:
             typer.secho("Server Offline. Cannot Sync.", fg=typer.colors.YELLOW)
-            return {}
+            return Vault()
+
+    def _apply_deltas(self, vault: dict):
+        resp = self.session.get(f"{SERVER_URL}/vault/deltas", headers=self._auth_headers())
+        resp.raise_for_status()
+        for delta_b64 in resp.json().get("deltas", []):
+            record = self.crypto.decrypt(a2b_base64(delta_b64))
+            if record.get("op") == "del":
+                vault.pop(record["name"], None)
+            else:
+                vault[record["name"]] = record["entry"]
+
+    def push_change(self, vault: dict, op: str, name: str, entry: dict = None):
+        # Ship only the changed entry; the server appends it to the journal
+        record = self.crypto.encrypt({"op": op, "name": name, "entry": entry})
+        headers = self._auth_headers()
+        headers["Content-Type"] = "application/octet-stream"
+        resp = self.session.post(f"{SERVER_URL}/vault/delta", data=record, headers=headers)
+        resp.raise_for_status()
+        if resp.json().get("pending", 0) >= self.COMPACT_AFTER:
+            self.push(vault)
+        else:
+            typer.secho("Synced with Server", fg=typer.colors.GREEN)
 
     def push(self, data: dict):
         encrypted_blob = self.crypto.encrypt(data)
-        payload = {
-            "username": USERNAME,
-            "client_auth_hash": self.crypto.auth_hash,
-            "vault_blob": encrypted_blob
-        }
-        resp = self.session.post(f"{SERVER_URL}/vault/upload", json=payload)
+        headers = self._auth_headers()
+        headers["Content-Type"] = "application/octet-stream"
+        resp = self.session.post(f"{SERVER_URL}/vault/upload", data=encrypted_blob, headers=headers)
         resp.raise_for_status()
         typer.secho("Synced with Server", fg=typer.colors.GREEN)
 
+@app.callback()
+def main(ctx: typer.Context):
+    # Build the crypto engine and sync client once per invocation; every
+    # command below pulls the shared pair out of the context instead of
+    # re-reading the key file and re-deriving keys itself.
+    crypto = CryptoEngine(USB_KEY_PATH)
+    ctx.obj = (crypto, VaultSync(crypto))
+
 # API Key Sub-Command Group 
 api_app = typer.Typer()
 app.add_typer(api_app, name="api", help="Manage API Keys and Secrets")
 
 @api_app.command("add")
 def add_api(
+    ctx: typer.Context,
     name: str = typer.Option(..., prompt="Service Name"),
     key: str = typer.Option(..., prompt="API Key / Public Key", hide_input=True),
     secret: str = typer.Option("", prompt="Secret Key (Optional, press Enter to skip)", hide_input=True)
 ):
-    crypto = CryptoEngine(USB_KEY_PATH)
-    sync = VaultSync(crypto)
-    
+    crypto, sync = ctx.obj
     vault = sync.pull()
     
     vault[name] = {
@@ -118,15 +264,15 @@ def add_api(
         "secret": secret
     }
     
-    sync.push(vault)
+    sync.push_change(vault, "set", name, vault[name])
     typer.secho(f"Success: API credentials for '{name}' saved.", fg=typer.colors.GREEN)
 
 @api_app.command("get")
 def get_api(
+    ctx: typer.Context,
     name: str = typer.Option(..., prompt="Which API key do you need?")
 ):
-    crypto = CryptoEngine(USB_KEY_PATH)
-    sync = VaultSync(crypto)
+    crypto, sync = ctx.obj
     vault = sync.pull()
     
     if name not in vault:
@@ -142,6 +288,7 @@ def get_api(
     typer.secho(f"API: {name}", fg=typer.colors.BLUE, bold=True)
 
     # Copy Key Logic
+    import pyperclip
     try:
         pyperclip.copy(data['key'])
         typer.secho("Public Key copied to clipboard!", fg=typer.colors.GREEN)
@@ -156,16 +303,12 @@ def get_api(
         typer.echo("No secret key stored.")
 
 @api_app.command("ls")
-def list_apis():
-    crypto = CryptoEngine(USB_KEY_PATH)
-    sync = VaultSync(crypto)
+def list_apis(ctx: typer.Context):
+    crypto, sync = ctx.obj
     vault = sync.pull()
     
-    apis = []
-    for name, data in vault.items():
-        if isinstance(data, dict) and data.get("type") == "apikey":
-            apis.append(name)
-            
+    apis = vault.by_type("apikey")
+
     if not apis:
         typer.secho("No API keys found.", fg=typer.colors.YELLOW)
         raise typer.Exit()
@@ -176,10 +319,10 @@ def list_apis():
 
 @api_app.command("edit")
 def edit_api(
+    ctx: typer.Context,
     name: str = typer.Option(..., prompt="Which API entry to edit?")
 ):
-    crypto = CryptoEngine(USB_KEY_PATH)
-    sync = VaultSync(crypto)
+    crypto, sync = ctx.obj
     vault = sync.pull()
 
     if name not in vault:
@@ -210,8 +353,11 @@ def edit_api(
         "key": new_key,
         "secret": new_secret
     }
-    
-    sync.push(vault)
+
+    # Set before del: a crash between the two leaves a duplicate, not a loss
+    sync.push_change(vault, "set", new_name, vault[new_name])
+    if new_name != name:
+        sync.push_change(vault, "del", name)
     typer.secho("Success: API details updated.", fg=typer.colors.GREEN)
 
 # Card Sub-Command Group
@@ -220,6 +366,7 @@ app.add_typer(card_app, name="card", help="Manage credit and debit cards")
 
 @card_app.command("add")
 def add_card(
+    ctx: typer.Context,
     name: str = typer.Option(..., prompt="Card Name"),
     holder: str = typer.Option(..., prompt="Cardholder Name"),
     number: str = typer.Option(..., prompt="Card Number", hide_input=True),
@@ -227,9 +374,7 @@ def add_card(
     cvv: str = typer.Option(..., prompt="CVV/CVC", hide_input=True),
     pin: str = typer.Option("", prompt="PIN (Optional, press Enter to skip)", hide_input=True)
 ):
-    crypto = CryptoEngine(USB_KEY_PATH)
-    sync = VaultSync(crypto)
-    
+    crypto, sync = ctx.obj
     vault = sync.pull()
     
     vault[name] = {
@@ -241,15 +386,15 @@ def add_card(
         "pin": pin
     }
     
-    sync.push(vault)
+    sync.push_change(vault, "set", name, vault[name])
     typer.secho(f"Card '{name}' saved securely.", fg=typer.colors.GREEN)
 
 @card_app.command("get")
 def get_card(
+    ctx: typer.Context,
     name: str = typer.Option(..., prompt="Which card do you need?")
 ):
-    crypto = CryptoEngine(USB_KEY_PATH)
-    sync = VaultSync(crypto)
+    crypto, sync = ctx.obj
     vault = sync.pull()
     
     if name not in vault:
@@ -266,6 +411,7 @@ def get_card(
     typer.echo(f"Holder: {data['holder']}")
     typer.echo(f"Expiry: {data['expiry']}")
 
+    import pyperclip
     try:
         pyperclip.copy(data['number'])
         typer.secho("Card number copied to clipboard!", fg=typer.colors.GREEN)
@@ -281,10 +427,10 @@ def get_card(
 
 @card_app.command("edit")
 def edit_card(
+    ctx: typer.Context,
     name: str = typer.Option(..., prompt="Which card do you want to edit?")
 ):
-    crypto = CryptoEngine(USB_KEY_PATH)
-    sync = VaultSync(crypto)
+    crypto, sync = ctx.obj
     vault = sync.pull()
 
     if name not in vault:
@@ -322,21 +468,20 @@ def edit_card(
         "cvv": cvv,
         "pin": pin
     }
-    
-    sync.push(vault)
+
+    # Set before del: a crash between the two leaves a duplicate, not a loss
+    sync.push_change(vault, "set", new_name, vault[new_name])
+    if new_name != name:
+        sync.push_change(vault, "del", name)
     typer.secho("Success: Card details updated.", fg=typer.colors.GREEN)
 
 @card_app.command("ls")
-def list_cards():
-    crypto = CryptoEngine(USB_KEY_PATH)
-    sync = VaultSync(crypto)
+def list_cards(ctx: typer.Context):
+    crypto, sync = ctx.obj
     vault = sync.pull()
     
-    cards = []
-    for name, data in vault.items():
-        if isinstance(data, dict) and data.get("type") == "card":
-            cards.append(name)
-            
+    cards = vault.by_type("card")
+
     if not cards:
         typer.secho("No cards found.", fg=typer.colors.YELLOW)
         raise typer.Exit()
@@ -348,24 +493,24 @@ def list_cards():
 # Main Password Manager Commands
 @app.command()
 def init(
+    ctx: typer.Context,
     username: str = typer.Option(..., prompt="Enter your username:"),
 ):
-    crypto = CryptoEngine(USB_KEY_PATH)
+    crypto, _ = ctx.obj
     payload = {"username": username, "client_auth_hash": crypto.auth_hash}
-    resp = requests.post(f"{SERVER_URL}/register", json=payload)
+    resp = get_session().post(f"{SERVER_URL}/register", json=payload)
     typer.echo(resp.json())
     with open(".env", "w") as f:
         f.write("USERNAME=" + username + "\n")
 
 @app.command()
 def add(
+    ctx: typer.Context,
     site: str = typer.Option(..., prompt="What is the site/service name?"),
     username: str = typer.Option(..., prompt="Enter the username/email"),
     password: str = typer.Option(..., prompt="Enter the password", hide_input=True, confirmation_prompt=True)
 ):
-    crypto = CryptoEngine(USB_KEY_PATH)
-    sync = VaultSync(crypto)
-    
+    crypto, sync = ctx.obj
     vault = sync.pull()
     
     vault[site] = {
@@ -374,15 +519,14 @@ def add(
     }
     
     typer.secho(f"Saved credentials for {site}", fg=typer.colors.GREEN)
-    sync.push(vault)
+    sync.push_change(vault, "set", site, vault[site])
 
 @app.command()
 def get(
+    ctx: typer.Context,
     site: str = typer.Option(..., prompt="Which site do you need?")
 ):
-    crypto = CryptoEngine(USB_KEY_PATH)
-    sync = VaultSync(crypto)
-    
+    crypto, sync = ctx.obj
     vault = sync.pull()
     if site in vault:
         entry = vault[site]
@@ -395,7 +539,8 @@ def get(
             pwd = entry
             
         typer.secho(f"Username: {user}", fg=typer.colors.CYAN)
-        
+
+        import pyperclip
         try:
             pyperclip.copy(pwd)
             typer.secho(f"Password for '{site}' copied to clipboard!", fg=typer.colors.GREEN, bold=True)
@@ -407,11 +552,10 @@ def get(
 
 @app.command()
 def delete(
+    ctx: typer.Context,
     site: str = typer.Option(..., prompt="Which site do you want to delete?")
 ):
-    crypto = CryptoEngine(USB_KEY_PATH)
-    sync = VaultSync(crypto)
-    
+    crypto, sync = ctx.obj
     vault = sync.pull()
     
     if site not in vault:
@@ -425,15 +569,15 @@ def delete(
         raise typer.Exit()
 
     del vault[site]
-    sync.push(vault)
+    sync.push_change(vault, "del", site)
     typer.secho(f"Password for '{site}' deleted.", fg=typer.colors.GREEN)
 
 @app.command()
 def edit(
+    ctx: typer.Context,
     site: str = typer.Option(..., prompt="Which site do you want to edit?")
 ):
-    crypto = CryptoEngine(USB_KEY_PATH)
-    sync = VaultSync(crypto)
+    crypto, sync = ctx.obj
     vault = sync.pull()
 
     if site not in vault:
@@ -471,14 +615,16 @@ def edit(
         "username": new_user,
         "password": new_pass
     }
-    
-    sync.push(vault)
+
+    # Set before del: a crash between the two leaves a duplicate, not a loss
+    sync.push_change(vault, "set", new_name, vault[new_name])
+    if new_name != site:
+        sync.push_change(vault, "del", site)
     typer.secho("Success: Entry updated.", fg=typer.colors.GREEN)
 
 @app.command()
-def ls():
-    crypto = CryptoEngine(USB_KEY_PATH)
-    sync = VaultSync(crypto)
+def ls(ctx: typer.Context):
+    crypto, sync = ctx.obj
     vault = sync.pull()
     
     typer.echo("Your Vault:")
@@ -1,55 +1,88 @@
+import hashlib
+import hmac
+import json
+from binascii import a2b_base64, b2a_base64
 import sqlite3
-from typing import Optional
-from fastapi import FastAPI, HTTPException, Header
+import threading
+from fastapi import FastAPI, HTTPException, Header, Request, Response
+from fastapi.responses import ORJSONResponse
 from pydantic import BaseModel
 from contextlib import asynccontextmanager
 
-DB_PATH = '/mnt/nas/data.db'  
-# DB_PATH = 'jason_vault.db'
+DB_PATH = '/mnt/nas/data.db'
+# DB_PATH = 'jason_vault.db'
+
+# One connection for the whole process; sync endpoints run in a threadpool,
+# so every use below goes through _db_lock
+_db = None
+_db_lock = threading.Lock()
 
 def get_db():
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row 
-    return conn
+    global _db
+    if _db is None:
+        _db = sqlite3.connect(DB_PATH, check_same_thread=False)
+        _db.row_factory = sqlite3.Row
+    return _db
 
 def init_db():
-    with get_db() as conn:
-        conn.execute('''
-            CREATE TABLE IF NOT EXISTS users (
-                username TEXT PRIMARY KEY,
-                auth_hash TEXT NOT NULL,
-                vault_blob TEXT
-            )
-        ''')
-        conn.commit()
+    conn = get_db()
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            username TEXT PRIMARY KEY,
+            auth_hash TEXT NOT NULL,
+            vault_blob BLOB,
+            deltas TEXT DEFAULT '[]'
+        )
+    ''')
+    try:
+        # Databases created before the delta journal existed
+        conn.execute("ALTER TABLE users ADD COLUMN deltas TEXT DEFAULT '[]'")
+    except sqlite3.OperationalError:
+        pass
+    # Databases written before the binary protocol stored the vault as a
+    # base64 TEXT string; convert those rows to raw bytes once. The result
+    # is untagged nonce||ciphertext, which clients still accept as legacy.
+    legacy_rows = conn.execute(
+        "SELECT username, vault_blob FROM users WHERE typeof(vault_blob) = 'text'"
+    ).fetchall()
+    for row in legacy_rows:
+        conn.execute(
+            "UPDATE users SET vault_blob = ? WHERE username = ?",
+            (a2b_base64(row['vault_blob']), row['username'])
+        )
+    # The PRAGMAs below refuse to run inside the conversion's transaction
+    conn.commit()
+    # WAL keeps uploads from stalling on a rollback-journal fsync; the
+    # whole table is tiny so the mmap ceiling is generous
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA mmap_size=268435456")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.commit()
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     init_db()
     yield
+    get_db().close()
 
 
-app = FastAPI(lifespan=lifespan, title="PasswordManager")
+app = FastAPI(lifespan=lifespan, title="PasswordManager", default_response_class=ORJSONResponse)
 
 class RegisterRequest(BaseModel):
     username: str
     client_auth_hash: str
 
-class VaultSyncRequest(BaseModel):
-    username: str
-    client_auth_hash: str
-    vault_blob: Optional[str] = None
-
-def verify_user(cursor, username: str, provided_hash: str):
-    cursor.execute("SELECT auth_hash FROM users WHERE username = ?", (username,))
-    row = cursor.fetchone()
-    
+def verify_user(row, provided_hash: str):
+    # Callers fetch auth_hash together with whatever else they need, so
+    # auth costs no extra statement
     if not row:
         raise HTTPException(status_code=404, detail="User not found")
-    
-    if row['auth_hash'] != provided_hash:
+
+    # Constant-time compare; a plain != leaks how many hex chars matched
+    if not hmac.compare_digest(row['auth_hash'], provided_hash):
         raise HTTPException(status_code=401, detail="Invalid Authentication")
-    
+
     return True
 
 
@@ -59,11 +92,11 @@ def health_check():
 
 @app.post("/register")
 def register_user(req: RegisterRequest):
-    with get_db() as conn:
+    with _db_lock, get_db() as conn:
         try:
             conn.execute(
                 "INSERT INTO users (username, auth_hash, vault_blob) VALUES (?, ?, ?)",
-                (req.username, req.client_auth_hash, "")
+                (req.username, req.client_auth_hash, b"")
             )
             conn.commit()
         except sqlite3.IntegrityError:
@@ -72,30 +105,82 @@ def register_user(req: RegisterRequest):
     return {"message": f"User '{req.username}' registered successfully."}
 
 @app.post("/vault/upload")
-def upload_vault(req: VaultSyncRequest):
-    if not req.vault_blob:
+async def upload_vault(request: Request, x_user: str = Header(...), x_auth: str = Header(...)):
+    # The vault arrives as raw nonce||ciphertext bytes, no base64/JSON wrapper
+    blob = await request.body()
+    if not blob:
         raise HTTPException(status_code=400, detail="No vault blob provided")
 
-    with get_db() as conn:
+    with _db_lock, get_db() as conn:
         cursor = conn.cursor()
-        verify_user(cursor, req.username, req.client_auth_hash)
-        
+        cursor.execute("SELECT auth_hash FROM users WHERE username = ?", (x_user,))
+        verify_user(cursor.fetchone(), x_auth)
+
+        # A full upload is the compacted state, so the journal resets
         cursor.execute(
-            "UPDATE users SET vault_blob = ? WHERE username = ?",
-            (req.vault_blob, req.username)
+            "UPDATE users SET vault_blob = ?, deltas = '[]' WHERE username = ?",
+            (blob, x_user)
         )
         conn.commit()
-        
-    return {"status": "synced", "bytes_stored": len(req.vault_blob)}
 
-@app.post("/vault/download")
-def download_vault(req: VaultSyncRequest):
-    with get_db() as conn:
+    return {"status": "synced", "bytes_stored": len(blob)}
+
+@app.post("/vault/delta")
+async def push_delta(request: Request, x_user: str = Header(...), x_auth: str = Header(...)):
+    # One encrypted change record; the server just appends it unopened
+    record = await request.body()
+    if not record:
+        raise HTTPException(status_code=400, detail="No delta provided")
+
+    with _db_lock, get_db() as conn:
         cursor = conn.cursor()
-        verify_user(cursor, req.username, req.client_auth_hash)
-        
-        cursor.execute("SELECT vault_blob FROM users WHERE username = ?", (req.username,))
+        cursor.execute("SELECT auth_hash, deltas FROM users WHERE username = ?", (x_user,))
         row = cursor.fetchone()
-        
-    blob = row['vault_blob'] if row and row['vault_blob'] else ""
-    return {"vault_blob": blob}
\ No newline at end of file
+        verify_user(row, x_auth)
+        deltas = json.loads(row['deltas'] or '[]')
+        deltas.append(b2a_base64(record, newline=False).decode('ascii'))
+
+        cursor.execute(
+            "UPDATE users SET deltas = ? WHERE username = ?",
+            (json.dumps(deltas), x_user)
+        )
+        conn.commit()
+
+    return {"status": "queued", "pending": len(deltas)}
+
+@app.get("/vault/deltas")
+def download_deltas(x_user: str = Header(...), x_auth: str = Header(...)):
+    with _db_lock, get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT auth_hash, deltas FROM users WHERE username = ?", (x_user,))
+        row = cursor.fetchone()
+        verify_user(row, x_auth)
+
+    return {"deltas": json.loads(row['deltas'] or '[]')}
+
+@app.get("/vault/download")
+def download_vault(x_user: str = Header(...), x_auth: str = Header(...),
+                   if_none_match: str = Header(None)):
+    with _db_lock, get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT auth_hash, vault_blob, deltas FROM users WHERE username = ?", (x_user,))
+        row = cursor.fetchone()
+        verify_user(row, x_auth)
+
+    blob = row['vault_blob'] if row['vault_blob'] else b""
+    if isinstance(blob, str):
+        # A pre-series TEXT row that dodged the init_db conversion (e.g. a
+        # restored backup); decode it rather than crash the hash below
+        blob = a2b_base64(blob)
+    pending = len(json.loads(row['deltas'] or '[]')) if row else 0
+    etag = hashlib.blake2b(blob, digest_size=8).hexdigest()
+    headers = {"X-Delta-Count": str(pending), "ETag": etag}
+
+    # Clients cache the blob locally; an unchanged vault costs no body bytes
+    if if_none_match == etag:
+        return Response(status_code=304, headers=headers)
+    return Response(
+        content=blob,
+        media_type="application/octet-stream",
+        headers=headers
+    )
\ No newline at end of file
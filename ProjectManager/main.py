@@ -1,11 +1,14 @@
 import os
 import shutil
+import subprocess
 
-from flask import Flask, render_template, jsonify, request
+from flask import Flask, render_template, jsonify, request, Response
+from flask.json.provider import DefaultJSONProvider
 from pathlib import Path
-from dataclasses import dataclass
+from contextlib import contextmanager
+from dataclasses import dataclass, field, asdict
 from enum import Enum
-import json
+import orjson
 from uuid import uuid4
 from git import Repo
 from dotenv import load_dotenv
@@ -21,30 +24,31 @@ class ProjectType(str, Enum):
     HOMELAB = "homelab"
     ALPHA = "alpha"
 
+# Checked before constructing the enum so bad input costs a set lookup,
+# not a raised ValueError
+_VALID_TYPES = frozenset(t.value for t in ProjectType)
+
+@dataclass(slots=True)
 class Project:
-    def __init__(self, name, type, tag, uuid=None):
-        self.name = name
-        self.type = type
-        self.tag = tag
-        if uuid:
-            self.uuid = uuid
-        else:
-            self.uuid = str(uuid4())
+    name: str
+    type: str
+    tag: str
+    uuid: str = field(default_factory=lambda: str(uuid4()))
 
     def create_project(self):
         project_path = storage_path / f"Project {self.name}"
-        if project_path.exists():
+        try:
+            # One atomic mkdir replaces the exists()-then-create pair,
+            # saving a stat round-trip to the NAS and closing the race
+            project_path.mkdir(parents=True)
+        except FileExistsError:
             return 1
         try:
-            project_path.mkdir(parents=True, exist_ok=True)
             repo = Repo.init(project_path)
-            (project_path / "README.md").touch()
+            # write_text creates the file itself; no touch() needed first
             (project_path / "README.md").write_text(f"# {self.name}\n\nType: {self.type}\nTag: {self.tag}\n")
-            (project_path / "requirements.txt").touch()
-            (project_path / ".gitignore").touch()
-            (project_path / "Dockerfile").touch()
-            (project_path / ".dockerignore").touch()
-            (project_path / ".env").touch()
+            for scaffold in ("requirements.txt", ".gitignore", "Dockerfile", ".dockerignore", ".env"):
+                (project_path / scaffold).touch()
             return 0
         except Exception as e:
             return 2
@@ -53,91 +57,168 @@ class Project:
         project_path = storage_path / f"Project {self.name}"
         if project_path.exists():
             try:
-                shutil.rmtree(project_path)
+                if os.name == 'posix':
+                    # rm walks the tree in C; shutil.rmtree pays a Python
+                    # call per entry, which adds up on the NAS mount
+                    subprocess.run(["rm", "-rf", str(project_path)], check=True)
+                else:
+                    shutil.rmtree(project_path)
                 return 0
             except Exception as e:
                 print(f"Error deleting project: {e}")
                 return 1
         return 1
 
-    def json_serialize(self):
-        return (self.uuid, {
+    def to_dict(self):
+        return {
             "name": self.name,
             "type": self.type,
             "tag": self.tag
-        })
+        }
+
+    def json_serialize(self):
+        return (self.uuid, self.to_dict())
 
 class ProjectManager:
     def __init__(self):
-        self.projects = []
+        # Indexed both ways so lookups and removals stay O(1)
+        self._by_uuid = {}
+        self._by_name = {}
+        # Listing results are reused between mutations; update_registry
+        # drops the cache whenever the registry changes
+        self._list_cache = {}
+        # Pre-serialized /listprojects response, rebuilt after mutations
+        self._full_list_bytes = None
+        # batch() suspends per-mutation writes and flushes once at exit
+        self._write_suspended = False
+        self._dirty = False
 
     def add_project(self, project: Project) -> None:
-        self.projects.append(project)
+        self._by_uuid[project.uuid] = project
+        self._by_name[project.name] = project
         self.update_registry()
 
     def remove_project(self, project_uuid:str) -> None:
-        self.projects = [p for p in self.projects if p.uuid != project_uuid]
+        project = self._by_uuid.pop(project_uuid, None)
+        if project:
+            self._by_name.pop(project.name, None)
         self.update_registry()
 
     def list_projects(self, name: str = None, uuid: str = None) -> list:
+        key = (name, uuid)
+        if key in self._list_cache:
+            return self._list_cache[key]
         if name:
-            return [p.__dict__ for p in self.projects if p.name == f"{name}"]
-        if uuid:
-            return [p.__dict__ for p in self.projects if p.uuid == uuid]
-        return [p.__dict__ for p in self.projects]
+            project = self._by_name.get(name)
+            result = [asdict(project)] if project else []
+        elif uuid:
+            project = self._by_uuid.get(uuid)
+            result = [asdict(project)] if project else []
+        else:
+            result = [asdict(p) for p in self._by_uuid.values()]
+        self._list_cache[key] = result
+        return result
 
     def get_project_by_uuid(self, project_uuid: str) -> Project:
-        for p in self.projects:
-            if p.uuid == project_uuid:
-                return p
-        return None
+        return self._by_uuid.get(project_uuid)
+
+    @contextmanager
+    def batch(self):
+        # Group many add/remove calls into a single registry rewrite
+        self._write_suspended = True
+        try:
+            yield self
+        finally:
+            self._write_suspended = False
+            if self._dirty:
+                self.update_registry()
+
+    def get_full_list_bytes(self) -> bytes:
+        if self._full_list_bytes is None:
+            self._full_list_bytes = orjson.dumps({
+                "projects": self.list_projects(),
+                "status": "Successful"
+            })
+        return self._full_list_bytes
 
     def update_registry(self) -> None:
+        self._list_cache.clear()
+        self._full_list_bytes = None
+        if self._write_suspended:
+            self._dirty = True
+            return
+        self._dirty = False
         registry_path = storage_path / "project_registry.json"
-        registry_data = {p.uuid: p.json_serialize()[1] for p in self.projects}
-        json.dump(registry_data, registry_path.open('w'), indent=4)
+        tmp_path = storage_path / "project_registry.json.tmp"
+        registry_data = {p.uuid: p.to_dict() for p in self._by_uuid.values()}
+        # Serialize in one go so the file sees a single buffered write
+        # instead of a stream of tiny chunks; orjson emits bytes directly
+        payload = orjson.dumps(registry_data)
+        # Write the new registry next to the old one and swap it in, so a
+        # crash mid-write can never leave a truncated registry behind
+        with tmp_path.open('wb') as f:
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, registry_path)
 
     def load_registry(self) -> None:
         registry_path = storage_path / "project_registry.json"
         if registry_path.exists():
-            with registry_path.open('r') as f:
-                registry_data = json.load(f)
-                for uuid, pdata in registry_data.items():
-                    project = Project(
-                        name=pdata['name'],
-                        type=pdata['type'],
-                        tag=pdata['tag']
-                    )
-                    project.uuid = uuid
-                    self.projects.append(project)
+            registry_data = orjson.loads(registry_path.read_bytes())
+            for uuid, pdata in registry_data.items():
+                project = Project(
+                    name=pdata['name'],
+                    type=pdata['type'],
+                    tag=pdata['tag'],
+                    uuid=uuid
+                )
+                self._by_uuid[uuid] = project
+                self._by_name[project.name] = project
         else:
             registry_path.touch()
             registry_path.write_text("{}")
 
+class OrjsonProvider(DefaultJSONProvider):
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
 app = Flask(__name__)
+app.json = OrjsonProvider(app)
 DEFAULT_STORAGE = "/mnt/nas/Projects"
 
 storage_path = Path(os.environ.get("PROJECT_PATH", DEFAULT_STORAGE))
 storage_path.mkdir(parents=True, exist_ok=True)
 
-manager = ProjectManager()
-manager.load_registry()
+# Registry parsing is deferred to first use so importing the module
+# (e.g. a gunicorn worker booting) doesn't block on reading the NAS
+manager = None
+
+def get_manager() -> ProjectManager:
+    global manager
+    if manager is None:
+        manager = ProjectManager()
+        manager.load_registry()
+    return manager
 
 @app.route("/createproject", methods=["POST"])
 def create_project():
-    if request.is_json:
-        data = request.get_json()
+    data = request.get_json(silent=True)
+    if data is not None:
         response = {}
         projecttype = data.get('type', None)
         projecttag = data.get('Tag', None)
         projectname = data.get('name', None)
 
-        try:
-            projecttype = ProjectType(projecttype.lower())
-        except ValueError:
+        projecttype = projecttype.lower() if projecttype else None
+        if projecttype not in _VALID_TYPES:
             response['message'] = 'Invalid project type'
             response['status'] = 'Failed'
             return jsonify(response)
+        projecttype = ProjectType(projecttype)
 
         project = Project(
             name=projectname,
@@ -153,7 +234,7 @@ def create_project():
             response['message'] = 'Unexpected error occurred while creating project'
             response['status'] = 'Failed'
         else:
-            manager.add_project(project)
+            get_manager().add_project(project)
             response['message'] = 'Project created'
             response['status'] = 'Successful'
 
@@ -163,11 +244,12 @@ def create_project():
 
 @app.route("/deleteproject", methods=["POST"])
 def delete_project():
-    if request.is_json:
-        data = request.get_json()
+    data = request.get_json(silent=True)
+    if data is not None:
         response = {}
         projectname = data.get('name', None)
 
+        manager = get_manager()
         existing_projects = manager.list_projects(name=projectname)
 
         if not existing_projects:
@@ -201,19 +283,19 @@ def delete_project():
 
 @app.route("/listprojects", methods=["POST"])
 def list_projects():
-    if request.is_json:
-        data = request.get_json()
+    data = request.get_json(silent=True)
+    if data is not None:
         response = {}
         name = data.get('name', None)
         if name:
-            projects = manager.list_projects(name=name)
+            projects = get_manager().list_projects(name=name)
             response['projects'] = projects
             response['status'] = 'Successful'
             return jsonify(response)
-        projects = manager.list_projects()
-        response['projects'] = projects
-        response['status'] = 'Successful'
-        return jsonify(response)
+        # Full listing is served straight from pre-serialized bytes
+        return Response(get_manager().get_full_list_bytes(), mimetype='application/json')
 
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", debug=True)
\ No newline at end of file
+    # Production serving goes through gunicorn via wsgi.py; this
+    # entrypoint is for local runs, with the reloader/debugger opt-in
+    app.run(host="0.0.0.0", debug=bool(os.environ.get("FLASK_DEBUG")))
\ No newline at end of file